@@ -5,62 +5,91 @@ Run this if you don't have a public domain for webhooks.
 
 import time
 import logging
-from telegram_bot import handle_update, validate_config
-import requests
+from telegram_bot import TELEGRAM_TIMEOUT, build_http_session, dispatch_update, shutdown_workers, validate_config
 import os
+import orjson
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
+_GET_UPDATES_URL = f"{TELEGRAM_API_URL}/getUpdates"
+# Telegram holds getUpdates open until an update arrives or this many seconds
+# pass, so idle polls cost almost nothing. Keep it well under 60s: very long
+# long-poll windows are unreliable behind proxies and NAT.
+LONG_POLL_TIMEOUT = 25
+_TG_SESSION = build_http_session()
+# Last confirmed update offset is kept on disk so a restart does not make
+# Telegram re-deliver (and the bot re-answer) already handled updates.
+OFFSET_FILE = os.getenv('OFFSET_FILE', 'polling_offset.txt')
+OFFSET_SAVE_INTERVAL = 2
 
 
 def get_updates(offset: int = None) -> tuple[list, int]:
     """
     Get updates from Telegram using long polling.
+
+    Blocks until an update arrives or LONG_POLL_TIMEOUT seconds elapse.
     
     Args:
         offset: Update ID to start from
         
     Returns:
         Tuple of (updates list, next offset)
+
+    Raises:
+        Exception: on network or Telegram API errors, so the caller can back off
     """
+    payload = {
+        "timeout": LONG_POLL_TIMEOUT,
+        "allowed_updates": ["message"]
+    }
+    
+    if offset:
+        payload["offset"] = offset
+    
+    response = _TG_SESSION.post(
+        _GET_UPDATES_URL,
+        data=orjson.dumps(payload),
+        timeout=(TELEGRAM_TIMEOUT[0], LONG_POLL_TIMEOUT + 5)
+    )
+    response.raise_for_status()
+    
+    data = orjson.loads(response.content)
+    
+    if not data.get('ok'):
+        raise RuntimeError(f"Telegram API error: {data}")
+
+    updates = data.get('result', [])
+    next_offset = updates[-1]['update_id'] + 1 if updates else offset
+    return updates, next_offset
+
+
+def load_offset() -> Optional[int]:
+    """Read the saved update offset, or None if there is none."""
     try:
-        payload = {
-            "timeout": 30,
-            "allowed_updates": ["message"]
-        }
-        
-        if offset:
-            payload["offset"] = offset
-        
-        response = requests.post(
-            f"{TELEGRAM_API_URL}/getUpdates",
-            json=payload,
-            timeout=35
-        )
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get('ok'):
-            updates = data.get('result', [])
-            next_offset = updates[-1]['update_id'] + 1 if updates else offset
-            return updates, next_offset
-        else:
-            logger.error(f"Telegram API error: {data}")
-            return [], offset
-            
-    except Exception as e:
-        logger.error(f"Error getting updates: {e}")
-        return [], offset
+        with open(OFFSET_FILE, encoding='utf-8') as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable offset file %s: %s", OFFSET_FILE, e)
+        return None
+
+
+def save_offset(offset: int) -> None:
+    """Atomically write the update offset to OFFSET_FILE."""
+    tmp_path = OFFSET_FILE + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, OFFSET_FILE)
+    except OSError as e:
+        logger.error("Failed to save polling offset: %s", e)
 
 
 def run_polling():
@@ -71,7 +100,9 @@ def run_polling():
     
     logger.info("Starting bot with polling mode...")
     
-    offset = None
+    offset = load_offset()
+    saved_offset = offset
+    last_saved_at = 0.0
     
     try:
         while True:
@@ -79,24 +110,29 @@ def run_polling():
                 updates, offset = get_updates(offset)
                 
                 for update in updates:
-                    try:
-                        handle_update(update)
-                    except Exception as e:
-                        logger.error(f"Error processing update {update.get('update_id')}: {e}")
-                
-                if not updates:
-                    # No updates, just wait and try again
-                    time.sleep(1)
+                    dispatch_update(update)
+
+                # Debounced so bursts of updates do not rewrite the file each poll
+                now = time.monotonic()
+                if offset != saved_offset and now - last_saved_at >= OFFSET_SAVE_INTERVAL:
+                    save_offset(offset)
+                    saved_offset = offset
+                    last_saved_at = now
                     
             except KeyboardInterrupt:
                 logger.info("Bot interrupted by user")
                 break
             except Exception as e:
-                logger.error(f"Polling error: {e}")
+                logger.error("Polling error: %s", e)
                 time.sleep(5)  # Wait before retrying
                 
     except Exception as e:
-        logger.error(f"Fatal error in polling loop: {e}")
+        logger.error("Fatal error in polling loop: %s", e)
+    finally:
+        # Let in-flight replies finish; their updates are already acknowledged.
+        shutdown_workers()
+        if offset is not None and offset != saved_offset:
+            save_offset(offset)
 
 
 if __name__ == "__main__":
@@ -1,44 +1,122 @@
 import os
 import sys
+import atexit
+import html
 import json
 import random
 import logging
+import queue
 import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 import re
+import orjson
 import requests
-from typing import Optional, List, Dict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Optional, List, Dict, Deque, Tuple
 from dotenv import load_dotenv
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging. Records are handed to a queue and written to the console
+# by a background listener thread, so handlers never block message handling.
+_root_logger = logging.getLogger()
+if not _root_logger.handlers:
+    _log_queue = queue.SimpleQueue()
+    _console_handler = logging.StreamHandler()
+    _console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    _root_logger.addHandler(QueueHandler(_log_queue))
+    _root_logger.setLevel(logging.INFO)
+    _log_listener = QueueListener(_log_queue, _console_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
+# Never let a broken log record interrupt message handling.
+logging.raiseExceptions = False
 
 # Load environment variables
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+HAS_TG = bool(TELEGRAM_TOKEN)
+HAS_GROQ = bool(GROQ_API_KEY)
+BOT_ENABLED = HAS_TG and HAS_GROQ
+_GROQ_STATUS_STR = "đã sẵn sàng" if HAS_GROQ else "chưa có GROQ_API_KEY"
 BOT_USERNAME = (os.getenv('BOT_USERNAME') or '').lstrip('@')
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
+_SEND_MSG_URL = f"{TELEGRAM_API_URL}/sendMessage"
 GROQ_API_URL = os.getenv('GROQ_API_URL', "https://api.groq.com/openai/v1/chat/completions")
 try:
     CHAT_HISTORY_LENGTH = max(0, int(os.getenv('CHAT_HISTORY_LENGTH', '0')))
 except ValueError:
     CHAT_HISTORY_LENGTH = 0
+try:
+    BOT_WORKERS = max(1, int(os.getenv('BOT_WORKERS', '8')))
+except ValueError:
+    BOT_WORKERS = 8
+# Every worker may hold one Telegram and one Groq connection at a time (plus
+# the long-poll request), so keep enough pooled sockets for all of them.
+HTTP_POOL_SIZE = max(16, BOT_WORKERS + 1)
+# (connect, read) timeouts in seconds. Connects fail fast so a dead socket is
+# retried quickly; reads keep the full budget for slow completions.
+GROQ_TIMEOUT = (1.0, 2.0)
+TELEGRAM_TIMEOUT = (1.0, 5.0)
+try:
+    BOT_MAX_CHATS = max(1, int(os.getenv('BOT_MAX_CHATS', '4096')))
+except ValueError:
+    BOT_MAX_CHATS = 4096
 BOT_USER_ID = None
 BOT_MENTION_PATTERN = re.compile(rf"@{re.escape(BOT_USERNAME)}", re.IGNORECASE) if BOT_USERNAME else None
-if TELEGRAM_TOKEN and ':' in TELEGRAM_TOKEN:
+BOT_MENTION_LOWER = f"@{BOT_USERNAME.lower()}"
+# "@bot đây?" style presence ping, answered locally without calling Groq
+BOT_PING_PATTERN = re.compile(
+    rf"\A\s*@{re.escape(BOT_USERNAME)}\b\W*(?:đây|day)\W*\Z",
+    re.IGNORECASE
+) if BOT_USERNAME else None
+if HAS_TG and ':' in TELEGRAM_TOKEN:
     try:
         BOT_USER_ID = int(TELEGRAM_TOKEN.split(':', 1)[0])
     except ValueError:
         BOT_USER_ID = None
 
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "Connection": "keep-alive"
+}
+
+
+def build_http_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    """
+    Create a pooled keep-alive session so TLS connections are reused across calls.
+
+    Retries only cover connection-level failures and idempotent requests;
+    urllib3 never re-sends a POST on a retryable status code. The default
+    JSON Content-Type lets callers post pre-serialized bodies via data=.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+_TG_SESSION = build_http_session()
+_GROQ_SESSION = build_http_session({"Authorization": f"Bearer {GROQ_API_KEY}"})
+
+PRESENCE_REPLY = "Có mặt! Bạn cần gì nè?"
+
 # Fallback fun messages (Vietnamese)
-FALLBACK_MESSAGES = [
+FALLBACK_MESSAGES = (
     "Haha nghe vui à nha 😆",
     "Ủa gì zợ? 😂 kể nghe coi",
     "Bot xỉu ngang 🤣",
@@ -53,7 +131,7 @@ FALLBACK_MESSAGES = [
     "Bạn thật là một người hài hước 😄",
     "Mình thích điều đó! 👍",
     "Hehe, bạn biết cách làm vui lòng người ta 😉",
-]
+)
 
 # System prompt for Groq
 SYSTEM_PROMPT = "Bạn là bot chat vui vẻ trong group. Trả lời ngắn gọn, vui nhộn, và thân thiện. Không vượt quá 2 câu."
@@ -65,7 +143,12 @@ MOOD_TONES = {
 }
 DEFAULT_MOOD = "vui"
 MOOD_OPTIONS_TEXT = ", ".join(MOOD_TONES.keys())
-VI_DAY_NAMES = [
+# Mood changes rarely, so every mood's full system prompt is built once here.
+_PROMPT_BY_MOOD = {
+    mood_key: f"{SYSTEM_PROMPT}\nMood hiện tại: {tone}"
+    for mood_key, tone in MOOD_TONES.items()
+}
+VI_DAY_NAMES = (
     "Thứ Hai",
     "Thứ Ba",
     "Thứ Tư",
@@ -73,7 +156,31 @@ VI_DAY_NAMES = [
     "Thứ Sáu",
     "Thứ Bảy",
     "Chủ Nhật"
-]
+)
+TIME_KEYWORDS = (
+    "mấy giờ",
+    "giờ mấy",
+    "bây giờ là mấy giờ",
+    "hiện tại mấy giờ",
+    "giờ hiện tại",
+)
+DAY_KEYWORDS = (
+    "thứ mấy",
+    "hôm nay là thứ",
+    "nay là thứ",
+    "hôm nay ngày",
+    "ngày mấy",
+    "ngày bao nhiêu",
+)
+# One pattern for every intent keyword; the named group that matched tells
+# which intent it was, so each message is scanned once.
+INTENT_RE = re.compile(
+    "(?P<time>{})|(?P<day>{})".format(
+        "|".join(map(re.escape, TIME_KEYWORDS)),
+        "|".join(map(re.escape, DAY_KEYWORDS)),
+    ),
+    re.IGNORECASE
+)
 HELP_TEXT = (
     "Danh sách lệnh:\n"
     "/alive - Kiểm tra bot còn hoạt động.\n"
@@ -84,44 +191,187 @@ HELP_TEXT = (
 )
 if BOT_USERNAME:
     HELP_TEXT += f"Nhắc @{BOT_USERNAME} để gọi bot xác nhận.\n"
+HELP_TEXT_STRIPPED = HELP_TEXT.strip()
+
+
+class LRUDict(OrderedDict):
+    """Dict bounded to maxsize keys that evicts the least recently used one."""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = super().__getitem__(key)
+            self.move_to_end(key)
+            return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            if len(self) > self.maxsize:
+                self.popitem(last=False)
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing bursts of capacity at refill_rate per second."""
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """Take one token, waiting up to timeout seconds. Return False if none was available."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.refill_rate
+            if not block:
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def release(self) -> None:
+        """Give back a token taken by acquire() that ended up unused."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
 
-BOT_START_TIME = time.time()
-chat_mute_until: dict[int, float] = {}
-chat_mood: dict[int, str] = {}
-chat_auto_reply_mode: dict[int, str] = {}
 AUTO_REPLY_ALL = "all"
 AUTO_REPLY_MENTION = "mention"
-chat_history: Dict[int, List[Dict[str, str]]] = {}
 
 
-def escape_markdown(text: str) -> str:
-    """Escape characters that break Telegram Markdown links."""
-    if not text:
-        return text
+class ChatState:
+    """Per-chat settings kept in one record, so a message needs one lookup."""
+
+    __slots__ = ("mute_until", "mood", "auto_reply_mode")
+
+    def __init__(self):
+        self.mute_until = 0.0  # time.monotonic() deadline, 0 when not muted
+        self.mood = DEFAULT_MOOD
+        self.auto_reply_mode = AUTO_REPLY_ALL
+
+
+BOT_START_TIME = time.time()
+# Shared stand-in for missing update fields; read-only, never mutate it.
+_EMPTY: dict = {}
+_DEFAULT_CHAT_STATE = ChatState()
+# Per-chat state is bounded so chats the bot no longer hears from are
+# eventually forgotten instead of growing memory forever.
+chat_state: Dict[int, ChatState] = LRUDict(BOT_MAX_CHATS)
+chat_history: Dict[int, Deque[Dict[str, str]]] = LRUDict(BOT_MAX_CHATS)
+# Outgoing messages are paced to stay under Telegram's ~30 msg/s bot limit,
+# and each chat is held to about 1 msg/s (bursts of 3) so one noisy group
+# cannot starve the others; replies over the per-chat limit are dropped.
+SEND_RATE_TIMEOUT = 10
+_TG_BUCKET = TokenBucket(30, 30)
+_chat_send_buckets: Dict[int, TokenBucket] = LRUDict(BOT_MAX_CHATS)
+# Recent Groq replies keyed on the full prompt, so repeated inputs skip the
+# API call. Entries expire so replies are not pinned forever.
+GROQ_CACHE_SIZE = 1024
+GROQ_CACHE_TTL = 600
+_groq_cache: "OrderedDict[tuple, Tuple[float, str]]" = OrderedDict()
+_groq_cache_lock = threading.Lock()
+# Identical prompts that arrive while a Groq call is in flight wait for that
+# call instead of issuing their own (single-flight). They wait without a
+# timeout of their own: every HTTP attempt is time-bounded and the owner
+# always resolves the future, so they never outlast the owner's retries.
+_groq_inflight: Dict[tuple, Future] = {}
+_groq_inflight_lock = threading.Lock()
+# Only the latest bot replies are sent verbatim; older ones are folded into a
+# short system "ledger" so long histories cost fewer Groq tokens.
+HISTORY_VERBATIM_REPLIES = 3
+HISTORY_SUMMARY_SENTENCES = 2
+HISTORY_SUMMARY_MAX_CHARS = 160
+HISTORY_REPEAT_MARKER = "[repeat]"
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _get_cached_groq_reply(key: tuple) -> Optional[str]:
+    with _groq_cache_lock:
+        entry = _groq_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, reply = entry
+        if time.monotonic() - stored_at > GROQ_CACHE_TTL:
+            del _groq_cache[key]
+            return None
+        _groq_cache.move_to_end(key)
+        return reply
 
-    replacements = ['\\', '*', '_', '[', ']', '(', ')', '`']
-    for char in replacements:
-        text = text.replace(char, f"\\{char}")
-    return text
+
+def _store_groq_reply(key: tuple, reply: str) -> None:
+    with _groq_cache_lock:
+        _groq_cache[key] = (time.monotonic(), reply)
+        _groq_cache.move_to_end(key)
+        if len(_groq_cache) > GROQ_CACHE_SIZE:
+            _groq_cache.popitem(last=False)
 
 
 def get_groq_response(message_text: str, system_prompt: str, history: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
     """
-    Call Groq API to generate a fun response.
+    Get a fun response for the message, from cache or from Groq.
     
     Args:
         message_text: User's message text
         system_prompt: Prompt describing bot behavior
+        history: Recent conversation messages sent as context
         
     Returns:
         Generated response or None if failed
     """
+    history_key = tuple((entry["role"], entry["content"]) for entry in history or ())
+    # Case and spacing rarely change the answer, so "Chào  bot" and "chào bot"
+    # share one cache entry.
+    normalized_text = " ".join(message_text.lower().split())
+    cache_key = (system_prompt, history_key, normalized_text)
+    reply = _get_cached_groq_reply(cache_key)
+    if reply is not None:
+        logger.info("Groq cache hit")
+        return reply
+
+    with _groq_inflight_lock:
+        pending = _groq_inflight.get(cache_key)
+        if pending is None:
+            future = _groq_inflight[cache_key] = Future()
+    if pending is not None:
+        return pending.result()
+
+    reply = None
+    try:
+        reply = _request_groq_response(message_text, system_prompt, history)
+        if reply:
+            _store_groq_reply(cache_key, reply)
+    finally:
+        with _groq_inflight_lock:
+            _groq_inflight.pop(cache_key, None)
+        future.set_result(reply)
+    return reply
+
+
+def _request_groq_response(message_text: str, system_prompt: str, history: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+    """Call Groq API to generate a fun response. Returns None if failed."""
     try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         messages = [
             {"role": "system", "content": system_prompt}
         ]
@@ -134,14 +384,14 @@ def get_groq_response(message_text: str, system_prompt: str, history: Optional[L
             "messages": messages
         }
         
-        response = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=2)
+        response = _GROQ_SESSION.post(GROQ_API_URL, data=orjson.dumps(payload), timeout=GROQ_TIMEOUT)
         response.raise_for_status()
         
-        data = response.json()
+        data = orjson.loads(response.content)
         reply = data.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
         
         if reply:
-            logger.info(f"Groq response received: {reply[:50]}...")
+            logger.info("Groq response received: %s...", reply[:50])
             return reply
         else:
             logger.warning("Groq returned empty response")
@@ -151,10 +401,10 @@ def get_groq_response(message_text: str, system_prompt: str, history: Optional[L
         logger.warning("Groq API timeout")
         return None
     except requests.RequestException as e:
-        logger.error(f"Groq API error: {e}")
+        logger.error("Groq API error: %s", e)
         return None
     except Exception as e:
-        logger.error(f"Unexpected error calling Groq: {e}")
+        logger.error("Unexpected error calling Groq: %s", e)
         return None
 
 
@@ -163,40 +413,52 @@ def get_fallback_message() -> str:
     return random.choice(FALLBACK_MESSAGES)
 
 
+def _get_chat_state(chat_id: int) -> ChatState:
+    """Return the chat's state, or shared defaults if it has none (read-only)."""
+    return chat_state.get(chat_id) or _DEFAULT_CHAT_STATE
+
+
+def _ensure_chat_state(chat_id: int) -> ChatState:
+    state = chat_state.get(chat_id)
+    if state is None:
+        state = chat_state[chat_id] = ChatState()
+    return state
+
+
 def get_chat_mood(chat_id: int) -> str:
     """Return the configured mood for a chat."""
-    return chat_mood.get(chat_id, DEFAULT_MOOD)
+    return _get_chat_state(chat_id).mood
 
 
 def set_chat_mood(chat_id: int, mood: str) -> None:
     """Persist mood selection for a chat."""
-    chat_mood[chat_id] = mood
+    _ensure_chat_state(chat_id).mood = mood
 
 
 def build_system_prompt(chat_id: int) -> str:
     """Compose system prompt with mood instructions."""
-    mood_key = get_chat_mood(chat_id)
-    tone = MOOD_TONES.get(mood_key, MOOD_TONES[DEFAULT_MOOD])
-    return f"{SYSTEM_PROMPT}\nMood hiện tại: {tone}"
+    prompt = _PROMPT_BY_MOOD.get(get_chat_mood(chat_id))
+    return prompt if prompt is not None else _PROMPT_BY_MOOD[DEFAULT_MOOD]
 
 
 def get_auto_reply_mode(chat_id: int) -> str:
     """Return current auto reply mode for chat."""
-    return chat_auto_reply_mode.get(chat_id, AUTO_REPLY_ALL)
+    return _get_chat_state(chat_id).auto_reply_mode
 
 
 def set_auto_reply_mode(chat_id: int, mode: str) -> None:
     """Save auto reply mode for chat."""
-    chat_auto_reply_mode[chat_id] = mode
+    _ensure_chat_state(chat_id).auto_reply_mode = mode
 
 
 def append_chat_history_entry(chat_id: int, role: str, content: str) -> None:
     if CHAT_HISTORY_LENGTH <= 0 or not content:
         return
-    history = chat_history.setdefault(chat_id, [])
+    history = chat_history.get(chat_id)
+    if history is None:
+        history = chat_history.setdefault(chat_id, deque(maxlen=CHAT_HISTORY_LENGTH))
+    # The bounded deque drops the oldest entry itself once it is full.
     history.append({"role": role, "content": content})
-    if len(history) > CHAT_HISTORY_LENGTH:
-        del history[0: len(history) - CHAT_HISTORY_LENGTH]
 
 
 def record_conversation_turn(chat_id: int, user_text: Optional[str], bot_text: Optional[str]) -> None:
@@ -211,64 +473,161 @@ def record_conversation_turn(chat_id: int, user_text: Optional[str], bot_text: O
 def get_chat_history_messages(chat_id: int) -> List[Dict[str, str]]:
     if CHAT_HISTORY_LENGTH <= 0:
         return []
-    history = chat_history.get(chat_id, [])
-    return history[-CHAT_HISTORY_LENGTH:]
+    history = chat_history.get(chat_id)
+    return condense_history(list(history)) if history else []
+
+
+def summarize_reply(text: str) -> str:
+    """Shorten a bot reply to its first sentences for the history ledger."""
+    summary = " ".join(_SENTENCE_END_RE.split(text.strip(), HISTORY_SUMMARY_SENTENCES)[:HISTORY_SUMMARY_SENTENCES])
+    if len(summary) > HISTORY_SUMMARY_MAX_CHARS:
+        summary = summary[:HISTORY_SUMMARY_MAX_CHARS - 1].rstrip() + "…"
+    return summary
+
+
+def condense_history(history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Shrink chat history before it is sent to Groq.
+
+    Repeated consecutive bot replies collapse to a marker, and bot replies
+    older than the last HISTORY_VERBATIM_REPLIES are moved into one leading
+    system message with a short summary of each.
+    """
+    messages = []
+    last_reply = None
+    for entry in history:
+        if entry["role"] == "assistant":
+            if entry["content"] == last_reply:
+                messages.append({"role": "assistant", "content": HISTORY_REPEAT_MARKER})
+                continue
+            last_reply = entry["content"]
+        messages.append(entry)
+
+    reply_indexes = [i for i, entry in enumerate(messages) if entry["role"] == "assistant"]
+    old_indexes = set(reply_indexes[:-HISTORY_VERBATIM_REPLIES])
+    if not old_indexes:
+        return messages
+
+    ledger = []
+    condensed = []
+    for i, entry in enumerate(messages):
+        if i not in old_indexes:
+            condensed.append(entry)
+        elif entry["content"] != HISTORY_REPEAT_MARKER:
+            ledger.append(summarize_reply(entry["content"]))
+    if ledger:
+        condensed.insert(0, {"role": "system", "content": "Bot đã trả lời trước đó: " + " | ".join(ledger)})
+    return condensed
 
 
 def get_local_intent_reply(message_text: str) -> Optional[str]:
     """Return a local deterministic reply for time/date questions."""
     if not message_text:
         return None
-    normalized = message_text.lower()
-    now = datetime.now()
 
-    time_keywords = [
-        "mấy giờ",
-        "giờ mấy",
-        "bây giờ là mấy giờ",
-        "hiện tại mấy giờ",
-        "giờ hiện tại",
-    ]
-    if any(keyword in normalized for keyword in time_keywords):
+    match = INTENT_RE.search(message_text)
+    if not match:
+        return None
+
+    now = datetime.now()
+    if match.lastgroup == "time":
         return f"Bây giờ là {now.strftime('%H:%M')} (ngày {now.strftime('%d/%m/%Y')})."
+    day_name = VI_DAY_NAMES[now.weekday()]
+    return f"Hôm nay {day_name}, ngày {now.strftime('%d/%m/%Y')}"
 
-    day_keywords = [
-        "thứ mấy",
-        "hôm nay là thứ",
-        "nay là thứ",
-        "hôm nay ngày",
-        "ngày mấy",
-        "ngày bao nhiêu",
-    ]
-    if any(keyword in normalized for keyword in day_keywords):
-        day_name = VI_DAY_NAMES[now.weekday()]
-        return f"Hôm nay {day_name}, ngày {now.strftime('%d/%m/%Y')}"
 
-    return None
+def should_reply_to_mention(text: str) -> bool:
+    """Return True if the message is only a presence ping like "@bot đây?"."""
+    return bool(text and BOT_PING_PATTERN and BOT_PING_PATTERN.match(text))
 
 
 def extract_text_without_mention(text: str) -> tuple[str, bool]:
     """Remove bot mention from text and report if mention existed."""
     if not text or not BOT_MENTION_PATTERN:
         return text.strip(), False
+    # Cheap substring probe first: most messages never mention the bot.
+    if BOT_MENTION_LOWER not in text.lower():
+        return text.strip(), False
     cleaned, count = BOT_MENTION_PATTERN.subn(' ', text)
     return cleaned.strip(), count > 0
 
 
 def is_chat_muted(chat_id: int) -> bool:
     """Return True if the chat is currently muted."""
-    mute_until = chat_mute_until.get(chat_id)
-    if not mute_until:
+    # Expired deadlines are cleared in place here; chat_state is LRU-bounded,
+    # so stale mutes need no separate sweep.
+    state = chat_state.get(chat_id)
+    if state is None or not state.mute_until:
         return False
-    if time.time() >= mute_until:
-        chat_mute_until.pop(chat_id, None)
+    if time.monotonic() >= state.mute_until:
+        state.mute_until = 0.0
         return False
     return True
 
 
 def set_chat_mute(chat_id: int, minutes: int) -> None:
     """Mute a chat for the given number of minutes."""
-    chat_mute_until[chat_id] = time.time() + (minutes * 60)
+    _ensure_chat_state(chat_id).mute_until = time.monotonic() + (minutes * 60)
+
+
+def _cmd_alive(parts: List[str], chat_id: int) -> Optional[str]:
+    uptime_seconds = int(time.time() - BOT_START_TIME)
+    if uptime_seconds < 60:
+        uptime_display = f"{uptime_seconds} giây"
+    else:
+        uptime_display = f"{uptime_seconds // 60} phút"
+    return f"Bot vẫn sống khỏe ({uptime_display}). Groq {_GROQ_STATUS_STR}."
+
+
+def _cmd_help(parts: List[str], chat_id: int) -> Optional[str]:
+    return HELP_TEXT_STRIPPED
+
+
+def _cmd_mute(parts: List[str], chat_id: int) -> Optional[str]:
+    minutes = 10
+    if len(parts) > 1:
+        try:
+            minutes = int(parts[1])
+        except ValueError:
+            return "Vui lòng nhập số phút hợp lệ, ví dụ /mute 10."
+    if minutes <= 0:
+        return "Số phút phải lớn hơn 0."
+    set_chat_mute(chat_id, minutes)
+    return f"Đã im lặng trong {minutes} phút."
+
+
+def _cmd_mood(parts: List[str], chat_id: int) -> Optional[str]:
+    if len(parts) == 1:
+        current = get_chat_mood(chat_id)
+        return f"Mood hiện tại: {current}. Mood khả dụng: {MOOD_OPTIONS_TEXT}."
+    mood_raw = " ".join(parts[1:]).strip().lower()
+    mood_key = mood_raw.replace(" ", "_")
+    if mood_key not in MOOD_TONES:
+        return f"Mood không hợp lệ. Chọn một trong: {MOOD_OPTIONS_TEXT}."
+    set_chat_mood(chat_id, mood_key)
+    return f"Đã chuyển mood sang {mood_key}. {MOOD_TONES[mood_key]}"
+
+
+def _cmd_autoreply(parts: List[str], chat_id: int) -> Optional[str]:
+    if len(parts) == 1:
+        return f"Auto-reply hiện tại: {get_auto_reply_mode(chat_id)} (all/mention)."
+    mode = parts[1].lower()
+    if mode not in (AUTO_REPLY_ALL, AUTO_REPLY_MENTION):
+        return "Chỉ chấp nhận 'all' hoặc 'mention'. Ví dụ: /autoreply mention"
+    set_auto_reply_mode(chat_id, mode)
+    if mode == AUTO_REPLY_ALL:
+        return "Bot sẽ trả lời tất cả tin nhắn văn bản."
+    return "Bot sẽ chỉ trả lời khi được nhắc tên hoặc lệnh."
+
+
+_COMMANDS: Dict[str, Callable[[List[str], int], Optional[str]]] = {
+    "/alive": _cmd_alive,
+    "/help": _cmd_help,
+    "/start": _cmd_help,
+    "/mute": _cmd_mute,
+    "/mood": _cmd_mood,
+    "/autoreply": _cmd_autoreply,
+}
 
 
 def handle_command(message_text: str, chat_id: int) -> Optional[str]:
@@ -283,56 +642,32 @@ def handle_command(message_text: str, chat_id: int) -> Optional[str]:
     if '@' in command:
         command = command.split('@', 1)[0]
 
-    if command == '/alive':
-        uptime_seconds = int(time.time() - BOT_START_TIME)
-        if uptime_seconds < 60:
-            uptime_display = f"{uptime_seconds} giây"
-        else:
-            uptime_display = f"{uptime_seconds // 60} phút"
-        groq_status = "đã sẵn sàng" if GROQ_API_KEY else "chưa có GROQ_API_KEY"
-        return f"Bot vẫn sống khỏe ({uptime_display}). Groq {groq_status}."
+    handler = _COMMANDS.get(command)
+    return handler(parts, chat_id) if handler else None
 
-    if command in ('/help', '/start'):
-        return HELP_TEXT.strip()
 
-    if command == '/mute':
-        minutes = 10
-        if len(parts) > 1:
-            try:
-                minutes = int(parts[1])
-            except ValueError:
-                return "Vui lòng nhập số phút hợp lệ, ví dụ /mute 10."
-        if minutes <= 0:
-            return "Số phút phải lớn hơn 0."
-        set_chat_mute(chat_id, minutes)
-        return f"Đã im lặng trong {minutes} phút."
-
-    if command == '/mood':
-        if len(parts) == 1:
-            current = get_chat_mood(chat_id)
-            return f"Mood hiện tại: {current}. Mood khả dụng: {MOOD_OPTIONS_TEXT}."
-        mood_raw = " ".join(parts[1:]).strip().lower()
-        mood_key = mood_raw.replace(" ", "_")
-        if mood_key not in MOOD_TONES:
-            return f"Mood không hợp lệ. Chọn một trong: {MOOD_OPTIONS_TEXT}."
-        set_chat_mood(chat_id, mood_key)
-        return f"Đã chuyển mood sang {mood_key}. {MOOD_TONES[mood_key]}"
-
-    if command == '/autoreply':
-        if len(parts) == 1:
-            return f"Auto-reply hiện tại: {get_auto_reply_mode(chat_id)} (all/mention)."
-        mode = parts[1].lower()
-        if mode not in (AUTO_REPLY_ALL, AUTO_REPLY_MENTION):
-            return "Chỉ chấp nhận 'all' hoặc 'mention'. Ví dụ: /autoreply mention"
-        set_auto_reply_mode(chat_id, mode)
-        if mode == AUTO_REPLY_ALL:
-            return "Bot sẽ trả lời tất cả tin nhắn văn bản."
-        return "Bot sẽ chỉ trả lời khi được nhắc tên hoặc lệnh."
-
-    return None
-
-
-def send_telegram_message(chat_id: int, text: str, reply_to_message_id: int) -> bool:
+def _take_chat_send_token(chat_id: int) -> Optional[TokenBucket]:
+    """
+    Take a token from the chat's send budget without waiting.
+
+    Never sleep for a per-chat limit: the worker shard is shared with other
+    chats, so an over-limit chat is skipped before any Groq call is made.
+
+    Returns:
+        The chat's bucket (to hand to send_telegram_message), or None if the
+        chat is over its send rate
+    """
+    chat_bucket = _chat_send_buckets.get(chat_id)
+    if chat_bucket is None:
+        chat_bucket = _chat_send_buckets.setdefault(chat_id, TokenBucket(3, 1))
+    if not chat_bucket.acquire(block=False):
+        logger.warning("Chat %s is over its send rate, dropping message", chat_id)
+        return None
+    return chat_bucket
+
+
+def send_telegram_message(chat_id: int, text: str, reply_to_message_id: int,
+                          chat_bucket: Optional[TokenBucket] = None) -> bool:
     """
     Send a message to Telegram group.
     
@@ -340,42 +675,60 @@ def send_telegram_message(chat_id: int, text: str, reply_to_message_id: int) ->
         chat_id: Group chat ID
         text: Message text (with mention and response)
         reply_to_message_id: Message ID to reply to
+        chat_bucket: Bucket the per-chat token was taken from; the token is
+            given back if the message is dropped by the global limit
         
     Returns:
         True if successful, False otherwise
     """
+    if not _TG_BUCKET.acquire(timeout=SEND_RATE_TIMEOUT):
+        if chat_bucket is not None:
+            chat_bucket.release()
+        logger.warning("Rate limit reached, dropping message to chat %s", chat_id)
+        return False
+
+    response = None
     try:
         payload = {
             "chat_id": chat_id,
             "text": text,
             "reply_to_message_id": reply_to_message_id,
-            "parse_mode": "Markdown"
+            "parse_mode": "HTML"
         }
         
-        response = requests.post(
-            f"{TELEGRAM_API_URL}/sendMessage",
-            json=payload,
-            timeout=5
+        response = _TG_SESSION.post(
+            _SEND_MSG_URL,
+            data=orjson.dumps(payload),
+            timeout=TELEGRAM_TIMEOUT
         )
         response.raise_for_status()
 
-        logger.info(f"Message sent to chat {chat_id}")
+        logger.info("Message sent to chat %s", chat_id)
         return True
         
     except requests.RequestException as e:
         error_body = ''
-        if 'response' in locals() and response is not None:
+        if response is not None:
             try:
                 error_body = response.text
             except Exception:
                 error_body = ''
-        logger.error(f"Failed to send Telegram message: {e}. Response: {error_body}")
+        logger.error("Failed to send Telegram message: %s. Response: %s", e, error_body)
         return False
     except Exception as e:
-        logger.error(f"Unexpected error sending message: {e}")
+        logger.error("Unexpected error sending message: %s", e)
         return False
 
 
+def _mention_reply(user_id: int, username: str, reply: str) -> str:
+    """Build the HTML reply text: a mention link to the sender, then the reply."""
+    return ''.join((
+        '<a href="tg://user?id=', str(user_id), '">',
+        html.escape(username, quote=False), '</a> ',
+        html.escape(reply, quote=False)
+    ))
+
+
 def process_message(update: dict) -> None:
     """
     Process an incoming Telegram message and send a reply.
@@ -385,108 +738,96 @@ def process_message(update: dict) -> None:
     """
     try:
         # Extract message data
-        message = update.get('message', {})
+        message = update.get('message') or _EMPTY
         
         # Ignore if not a text message
         if not message or 'text' not in message:
-            logger.debug("Ignoring non-text message")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Ignoring non-text message")
             return
         
         # Ignore bot messages
-        from_user = message.get('from', {})
+        from_user = message.get('from') or _EMPTY
         if from_user.get('is_bot', False):
-            logger.debug("Ignoring bot message")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Ignoring bot message")
             return
         
         # Extract required fields
-        chat_id = message.get('chat', {}).get('id')
+        chat_id = (message.get('chat') or _EMPTY).get('id')
         message_id = message.get('message_id')
         user_id = from_user.get('id')
         # Use username if available, fallback to first_name
         username = from_user.get('username') or from_user.get('first_name') or 'User'
-        original_text = message.get('text', '')
+        original_text = message.get('text') or ''
         message_text = original_text.strip()
         cleaned_text, has_mention = extract_text_without_mention(original_text)
         auto_reply_mode = get_auto_reply_mode(chat_id)
         if has_mention:
-            if not cleaned_text:
-                reply_text = "Có mặt! Bạn cần gì nè?"
-                safe_username = escape_markdown(username)
-                safe_reply = escape_markdown(reply_text)
-                final_message = f"[{safe_username}](tg://user?id={user_id}) {safe_reply}"
-                send_telegram_message(chat_id, final_message, message_id)
-                user_entry = original_text.strip() or (f"@{BOT_USERNAME}" if BOT_USERNAME else original_text.strip())
-                record_conversation_turn(chat_id, user_entry, reply_text)
+            if not cleaned_text or should_reply_to_mention(original_text):
+                chat_bucket = _take_chat_send_token(chat_id)
+                if chat_bucket is None:
+                    return
+                if send_telegram_message(chat_id, _mention_reply(user_id, username, PRESENCE_REPLY), message_id, chat_bucket):
+                    user_entry = original_text.strip() or (f"@{BOT_USERNAME}" if BOT_USERNAME else original_text.strip())
+                    record_conversation_turn(chat_id, user_entry, PRESENCE_REPLY)
                 return
             message_text = cleaned_text
         elif auto_reply_mode == AUTO_REPLY_MENTION:
             # Only respond to commands when in mention-only mode
             if not message_text.startswith('/'):
-                logger.info(f"Chat {chat_id} ở chế độ mention, bỏ qua tin nhắn không mention")
+                logger.info("Chat %s ở chế độ mention, bỏ qua tin nhắn không mention", chat_id)
                 return
-        reply_to = message.get('reply_to_message') or {}
-        reply_to_user = reply_to.get('from', {}) if reply_to else {}
+        reply_to_user = (message.get('reply_to_message') or _EMPTY).get('from') or _EMPTY
         is_reply_to_bot = bool(BOT_USER_ID and reply_to_user.get('id') == BOT_USER_ID)
         
         # Validate extracted data
         if not all([chat_id, message_id, user_id, message_text]):
-            logger.warning(f"Missing required fields - chat_id: {chat_id}, message_id: {message_id}, user_id: {user_id}, text: {bool(message_text)}")
+            logger.warning("Missing required fields - chat_id: %s, message_id: %s, user_id: %s, text: %s", chat_id, message_id, user_id, bool(message_text))
             return
         
-        logger.info(f"Processing message from {username} (ID: {user_id}): {original_text[:50]}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Processing message from %s (ID: %s): %s", username, user_id, original_text[:50])
+
+        reply_text = None
+        user_entry = message_text
 
         # Quick reply when user replies directly to bot message
         if is_reply_to_bot and not original_text.strip():
-            reply_text = "Có mặt! Bạn cần gì nè?"
-            safe_username = escape_markdown(username)
-            safe_reply = escape_markdown(reply_text)
-            final_message = f"[{safe_username}](tg://user?id={user_id}) {safe_reply}"
-            send_telegram_message(chat_id, final_message, message_id)
-            record_conversation_turn(chat_id, original_text.strip(), reply_text)
-            return
+            reply_text = PRESENCE_REPLY
+            user_entry = original_text.strip()
 
         # Slash commands
-        command_reply = handle_command(message_text, chat_id)
-        if command_reply:
-            safe_username = escape_markdown(username)
-            safe_reply = escape_markdown(command_reply)
-            final_message = f"[{safe_username}](tg://user?id={user_id}) {safe_reply}"
-            send_telegram_message(chat_id, final_message, message_id)
-            record_conversation_turn(chat_id, message_text, command_reply)
-            return
+        if not reply_text:
+            reply_text = handle_command(message_text, chat_id)
 
-        # Respect mute state
-        if is_chat_muted(chat_id):
-            logger.info(f"Chat {chat_id} đang trong trạng thái im lặng, bỏ qua tin nhắn.")
-            return
+        if not reply_text:
+            # Respect mute state
+            if is_chat_muted(chat_id):
+                logger.info("Chat %s đang trong trạng thái im lặng, bỏ qua tin nhắn.", chat_id)
+                return
 
-        # Local deterministic replies (time/date queries)
-        local_reply = get_local_intent_reply(message_text)
-        if local_reply:
-            safe_username = escape_markdown(username)
-            safe_reply = escape_markdown(local_reply)
-            final_message = f"[{safe_username}](tg://user?id={user_id}) {safe_reply}"
-            send_telegram_message(chat_id, final_message, message_id)
-            record_conversation_turn(chat_id, message_text, local_reply)
-            return
+            # Local deterministic replies (time/date queries)
+            reply_text = get_local_intent_reply(message_text)
 
-        # Try to get AI response with mood-aware prompt, fallback if it fails
-        system_prompt = build_system_prompt(chat_id)
-        history_messages = get_chat_history_messages(chat_id)
-        ai_response = get_groq_response(message_text, system_prompt, history_messages)
-        reply_text = ai_response if ai_response else get_fallback_message()
+        # Spend the chat's send budget before the (slow) Groq call, not after
+        chat_bucket = _take_chat_send_token(chat_id)
+        if chat_bucket is None:
+            return
 
-        # Build final message with mention and escape Markdown characters in name
-        safe_username = escape_markdown(username)
-        safe_reply = escape_markdown(reply_text)
-        final_message = f"[{safe_username}](tg://user?id={user_id}) {safe_reply}"
+        if not reply_text:
+            # Try to get AI response with mood-aware prompt, fallback if it fails
+            system_prompt = build_system_prompt(chat_id)
+            history_messages = get_chat_history_messages(chat_id)
+            ai_response = get_groq_response(message_text, system_prompt, history_messages)
+            reply_text = ai_response if ai_response else get_fallback_message()
 
-        # Send reply
-        send_telegram_message(chat_id, final_message, message_id)
-        record_conversation_turn(chat_id, message_text, reply_text)
+        # Send reply with mention
+        if send_telegram_message(chat_id, _mention_reply(user_id, username, reply_text), message_id, chat_bucket):
+            record_conversation_turn(chat_id, user_entry, reply_text)
         
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
+        logger.error("Error processing message: %s", e)
 
 
 def handle_update(update: dict) -> None:
@@ -499,18 +840,62 @@ def handle_update(update: dict) -> None:
     try:
         process_message(update)
     except Exception as e:
-        logger.error(f"Error handling update: {e}")
+        logger.error("Error handling update: %s", e)
+
+
+# Updates are handled on worker threads so a slow Groq call never delays the
+# caller. Each chat is pinned to one single-threaded shard (chat_id % workers),
+# so a chat's messages are answered in order and its state is only touched by
+# one thread, while different chats still run in parallel. Chats that share a
+# shard do queue behind each other's Groq calls, so nothing on this path may
+# sleep for a per-chat reason (see _take_chat_send_token). The semaphore caps
+# queued + running updates, so callers pause (backpressure) instead of letting
+# the queues grow without bound.
+MAX_PENDING_UPDATES = 32
+_WORKER_SHARDS = [
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"bot-worker-{index}")
+    for index in range(BOT_WORKERS)
+]
+_PENDING_UPDATES = threading.BoundedSemaphore(MAX_PENDING_UPDATES)
+
+
+def _handle_update_and_release(update: dict) -> None:
+    try:
+        handle_update(update)
+    finally:
+        _PENDING_UPDATES.release()
+
+
+def _shard_for_update(update: dict) -> ThreadPoolExecutor:
+    chat_id = ((update.get('message') or _EMPTY).get('chat') or _EMPTY).get('id')
+    if not isinstance(chat_id, int):
+        chat_id = 0
+    return _WORKER_SHARDS[chat_id % len(_WORKER_SHARDS)]
+
+
+def dispatch_update(update: dict) -> None:
+    """Queue an update on its chat's worker, blocking while too many are pending."""
+    _PENDING_UPDATES.acquire()
+    try:
+        _shard_for_update(update).submit(_handle_update_and_release, update)
+    except Exception:
+        _PENDING_UPDATES.release()
+        raise
+
+
+def shutdown_workers() -> None:
+    """Wait for in-flight updates to finish and stop the workers."""
+    for shard in _WORKER_SHARDS:
+        shard.shutdown(wait=True)
 
 
 def validate_config() -> bool:
     """Validate required environment variables."""
-    if not TELEGRAM_TOKEN:
+    if not HAS_TG:
         logger.error("TELEGRAM_TOKEN not set in environment")
-        return False
-    if not GROQ_API_KEY:
+    elif not HAS_GROQ:
         logger.error("GROQ_API_KEY not set in environment")
-        return False
-    return True
+    return BOT_ENABLED
 
 
 def main():
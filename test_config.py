@@ -10,6 +10,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Same keep-alive pooling the bot uses for its API calls
+SESSION = requests.Session()
+
 def test_telegram_token():
     """Test Telegram bot token."""
     token = os.getenv('TELEGRAM_TOKEN')
@@ -19,7 +22,7 @@ def test_telegram_token():
         return False
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"https://api.telegram.org/bot{token}/getMe",
             timeout=5
         )
@@ -63,7 +66,7 @@ def test_groq_key():
             ]
         }
         
-        response = requests.post(
+        response = SESSION.post(
             "https://api.groq.com/openai/v1/chat/completions",
             headers=headers,
             json=payload,
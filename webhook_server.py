@@ -5,18 +5,16 @@ Receives updates from Telegram and processes them.
 
 import os
 import logging
+import orjson
 from flask import Flask, request, jsonify
+from waitress import serve
 from dotenv import load_dotenv
-from telegram_bot import handle_update, validate_config
+from telegram_bot import dispatch_update, validate_config
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging is configured by telegram_bot (queue-based console output)
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -27,6 +25,7 @@ TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', 'localhost')
 WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 5000))
 WEBHOOK_PATH = f"/{TELEGRAM_TOKEN}"
+WEBHOOK_THREADS = 4
 
 
 @app.route(WEBHOOK_PATH, methods=['POST'])
@@ -36,22 +35,24 @@ def webhook():
     Receives POST requests from Telegram servers.
     """
     try:
-        update = request.get_json()
+        body = request.get_data()
+        update = orjson.loads(body) if body else None
         
-        if not update:
+        if not isinstance(update, dict) or not update:
             logger.warning("Received empty update")
             return jsonify({"ok": False, "error": "Empty update"}), 400
         
-        logger.debug(f"Received update: {update}")
+        logger.debug("Received update: %s", update)
         
-        # Process the update asynchronously
-        handle_update(update)
+        # Hand off to the worker pool so Telegram gets its 200 OK without
+        # waiting for the Groq call and the reply to finish
+        dispatch_update(update)
         
         # Always return 200 OK to acknowledge to Telegram
         return jsonify({"ok": True}), 200
         
     except Exception as e:
-        logger.error(f"Error in webhook handler: {e}")
+        logger.error("Error in webhook handler: %s", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
@@ -72,12 +73,14 @@ if __name__ == "__main__":
         logger.error("Configuration validation failed")
         exit(1)
     
-    logger.info(f"Starting webhook server on {WEBHOOK_HOST}:{WEBHOOK_PORT}")
-    logger.info(f"Webhook path: {WEBHOOK_PATH}")
+    logger.info("Starting webhook server on %s:%s", WEBHOOK_HOST, WEBHOOK_PORT)
+    logger.info("Webhook path: %s", WEBHOOK_PATH)
     
-    app.run(
+    # Production WSGI server instead of Flask's development server; the
+    # handler only parses and queues the update, so a few threads suffice.
+    serve(
+        app,
         host=WEBHOOK_HOST,
         port=WEBHOOK_PORT,
-        debug=False,
-        threaded=True
+        threads=WEBHOOK_THREADS
     )